@@ -1,8 +1,14 @@
 import os
 import json
+from datetime import datetime, timedelta, timezone
 from firebase_admin import firestore
+from google.api_core.exceptions import AlreadyExists, GoogleAPICallError, RetryError, ServerError, TooManyRequests
+from googleapiclient.errors import HttpError
 from .firebase_config import db
-from .utils import get_gmail_service, extract_email_body, extract_google_form_links, extract_event_details, OFFICIAL_CLUB_SENDERS
+from .mail_stream import hub
+from .models import ClubMail
+from .profiling import span, traced, trace_tag
+from .utils import get_gmail_service, extract_email_body, extract_google_form_links, extract_event_details, OFFICIAL_CLUB_SENDERS, EVENT_TIMEZONE
 
 def get_last_history_id(user_email):
     if not user_email: return None
@@ -17,21 +23,172 @@ def save_history_id(user_email, history_id):
     user_ref = db.collection("users").document(user_email.lower())
     user_ref.set({"lastHistoryId": history_id}, merge=True)
 
-def is_message_processed(msg_id):
+# A message that fails this many times is moved to 'dead_letters' and skipped
+MAX_MESSAGE_ATTEMPTS = 3
+# How long a worker may hold a message before others assume it crashed
+MESSAGE_LEASE = timedelta(minutes=5)
+
+class MessageBusy(Exception):
+    """ Another worker holds an unexpired lease on the message. """
+
+def advance_history_id(user_email, history_id):
+    """
+    Move the user's lastHistoryId forward to history_id, never backwards,
+    so a slower scan can't rewind a checkpoint written by a newer one.
+    """
+    if not user_email or not history_id: return
+    user_ref = db.collection("users").document(user_email.lower())
+
+    @firestore.transactional
+    def _advance(transaction):
+        doc = user_ref.get(transaction=transaction)
+        current = doc.to_dict().get("lastHistoryId") if doc.exists else None
+        if current and int(current) >= int(history_id):
+            return
+        transaction.set(user_ref, {"lastHistoryId": history_id}, merge=True)
+
+    _advance(db.transaction())
+
+def is_transient_error(error):
+    """ Rate limits, server errors and network failures that are worth retrying. """
+    if isinstance(error, HttpError):
+        return error.resp.status == 429 or error.resp.status >= 500
+    if isinstance(error, (TooManyRequests, ServerError, RetryError)):
+        return True
+    if isinstance(error, GoogleAPICallError):
+        return False
+    return isinstance(error, (TimeoutError, ConnectionError))
+
+def claim_message(msg_id):
+    """
+    Take a lease on msg_id. Returns False if it was already processed (or
+    quarantined); raises MessageBusy if another worker is processing it.
+    """
     doc_ref = db.collection("processed_messages").document(msg_id)
-    return doc_ref.get().exists
+    now = datetime.now(timezone.utc)
+
+    @firestore.transactional
+    def _claim(transaction):
+        doc = doc_ref.get(transaction=transaction)
+        data = doc.to_dict() if doc.exists else {}
+        # Markers written before leases existed only have processed=True
+        if data.get("processed"):
+            return False
+        lease_until = data.get("lease_until")
+        if data.get("state") == "processing" and lease_until and lease_until > now:
+            raise MessageBusy(msg_id)
+        transaction.set(doc_ref, {
+            "processed": False,
+            "state": "processing",
+            "attempts": data.get("attempts", 0) + 1,
+            "lease_until": now + MESSAGE_LEASE
+        }, merge=True)
+        return True
+
+    return _claim(db.transaction())
 
 def mark_message_processed(msg_id):
     doc_ref = db.collection("processed_messages").document(msg_id)
     doc_ref.set({
         "processed": True,
+        "state": "done",
+        "lease_until": None,
+        "timestamp": firestore.SERVER_TIMESTAMP
+    }, merge=True)
+
+def mark_message_skipped(msg_id, reason):
+    """ Mark a message that can never be processed (e.g. deleted) as handled. """
+    doc_ref = db.collection("processed_messages").document(msg_id)
+    doc_ref.set({
+        "processed": True,
+        "state": "skipped",
+        "reason": reason,
+        "lease_until": None,
         "timestamp": firestore.SERVER_TIMESTAMP
-    })
+    }, merge=True)
+
+def record_message_failure(msg_id, user_email, error):
+    """
+    Release the lease after a failed attempt. Transient errors (see
+    is_transient_error) don't count as attempts, so an outage can't
+    quarantine good messages. Once MAX_MESSAGE_ATTEMPTS other failures are
+    reached the message is copied to 'dead_letters' and marked processed so
+    scans move past it. Returns True if the message was quarantined.
+    """
+    doc_ref = db.collection("processed_messages").document(msg_id)
+    doc = doc_ref.get()
+    attempts = doc.to_dict().get("attempts", 1) if doc.exists else 1
+
+    if is_transient_error(error):
+        # Give back the attempt claim_message counted
+        doc_ref.set({
+            "state": "failed",
+            "attempts": max(attempts - 1, 0),
+            "last_error": repr(error),
+            "lease_until": None
+        }, merge=True)
+        return False
+
+    if attempts >= MAX_MESSAGE_ATTEMPTS:
+        db.collection("dead_letters").document(msg_id).set({
+            "msg_id": msg_id,
+            "recipient": user_email.lower() if user_email else "unknown",
+            "error": repr(error),
+            "attempts": attempts,
+            "timestamp": firestore.SERVER_TIMESTAMP
+        })
+        doc_ref.set({
+            "processed": True,
+            "state": "dead_letter",
+            "lease_until": None,
+            "timestamp": firestore.SERVER_TIMESTAMP
+        }, merge=True)
+        print(f"{trace_tag()}Moved message {msg_id} to dead_letters after {attempts} attempts: {error}")
+        return True
+
+    doc_ref.set({
+        "state": "failed",
+        "last_error": repr(error),
+        "lease_until": None
+    }, merge=True)
+    return False
+
+def handle_message(service, msg_id, user_email):
+    """
+    Process msg_id at most once across workers and restarts.
+    Returns the extracted links ([] if already handled or quarantined).
+    Raises MessageBusy, or the processing error while retries remain.
+    """
+    if not claim_message(msg_id):
+        return []
+    try:
+        links = process_single_message(service, msg_id, user_email)
+    except HttpError as e:
+        if e.resp.status != 404:
+            print(f"{trace_tag()}Error processing message {msg_id}: {e}")
+            if record_message_failure(msg_id, user_email, e):
+                return []
+            raise
+        # Deleted between the push and the fetch: nothing to process, ever
+        print(f"{trace_tag()}Message {msg_id} no longer exists, skipping")
+        mark_message_skipped(msg_id, "not found")
+        return []
+    except Exception as e:
+        print(f"{trace_tag()}Error processing message {msg_id}: {e}")
+        if record_message_failure(msg_id, user_email, e):
+            return []
+        raise
+    mark_message_processed(msg_id)
+    return links
 
 def process_gmail_changes(new_history_id, user_email=None):
+    """
+    Scan the user's Gmail history from lastHistoryId, checkpointing after
+    each history record so a failure only re-scans from the failed message.
+    """
     service = get_gmail_service(user_email)
     if not service:
-        print(f"Error: No Gmail service available for {user_email}")
+        print(f"{trace_tag()}Error: No Gmail service available for {user_email}")
         return []
 
     last_id = get_last_history_id(user_email)
@@ -41,69 +198,81 @@ def process_gmail_changes(new_history_id, user_email=None):
             save_history_id(user_email, new_history_id)
         return []
 
+    extracted_links = []
+    page_token = None
     try:
-        history_results = service.users().history().list(
-            userId='me',
-            startHistoryId=last_id,
-            historyTypes=['messageAdded']
-        ).execute()
-
-        extracted_links = []
-        histories = history_results.get('history', [])
-        
-        for h in histories:
-            messages_added = h.get('messagesAdded', [])
-            for msg_item in messages_added:
-                msg = msg_item.get('message', {})
-                msg_id = msg.get('id')
-                
-                if msg_id and not is_message_processed(msg_id):
-                    links = process_single_message(service, msg_id, user_email)
-                    if links:
-                        extracted_links.extend(links)
-                    mark_message_processed(msg_id)
+        while True:
+            try:
+                with span("history_list"):
+                    history_results = service.users().history().list(
+                        userId='me',
+                        startHistoryId=last_id,
+                        historyTypes=['messageAdded'],
+                        pageToken=page_token
+                    ).execute()
+            except HttpError as e:
+                if e.resp.status != 404:
+                    raise
+                # startHistoryId is older than Gmail keeps; restart from the push
+                print(f"{trace_tag()}History {last_id} expired for {user_email}, resetting to {new_history_id}")
+                save_history_id(user_email, new_history_id)
+                return extracted_links
 
-        if user_email:
-            save_history_id(user_email, new_history_id)
+            for h in history_results.get('history', []):
+                for msg_item in h.get('messagesAdded', []):
+                    msg_id = msg_item.get('message', {}).get('id')
+                    if msg_id:
+                        extracted_links.extend(handle_message(service, msg_id, user_email))
+                # Every message in this record is committed or quarantined
+                with span("checkpoint"):
+                    advance_history_id(user_email, h.get('id'))
+
+            page_token = history_results.get('nextPageToken')
+            if not page_token:
+                break
+
+        advance_history_id(user_email, history_results.get('historyId') or new_history_id)
         return extracted_links
 
     except Exception as e:
-        print(f"Error processing history for {user_email}: {e}")
-        return []
+        # The checkpoint stays before the failed message; the next push resumes there
+        print(f"{trace_tag()}Error processing history for {user_email}: {e}")
+        return extracted_links
 
+@traced("process_single_message")
 def process_single_message(service, msg_id, user_email):
-    try:
-        msg_data = service.users().messages().get(
-            userId="me",
-            id=msg_id,
-            format="full"
-        ).execute()
-
-        payload = msg_data.get("payload", {})
-        headers = payload.get("headers", [])
-        
-        sender = next((h["value"] for h in headers if h["name"] == "From"), "").lower()
-        subject = next((h["value"] for h in headers if h["name"] == "Subject"), "Club Mail")
-        
-        # Filter by sender
-        is_official = any(email in sender for email in OFFICIAL_CLUB_SENDERS)
-        if not is_official:
-            return []
+    msg_data = service.users().messages().get(
+        userId="me",
+        id=msg_id,
+        format="full"
+    ).execute()
 
-        body_text = extract_email_body(payload)
-        links = extract_google_form_links(body_text)
-        details = extract_event_details(body_text)
-        
-        if links:
-            print(f"Extracted {len(links)} links from message {msg_id}")
-            save_extracted_links(links, msg_id, sender, subject, details, user_email)
-            
-        return links
-
-    except Exception as e:
-        print(f"Error processing message {msg_id}: {e}")
+    payload = msg_data.get("payload", {})
+    headers = payload.get("headers", [])
+    
+    sender = next((h["value"] for h in headers if h["name"] == "From"), "").lower()
+    subject = next((h["value"] for h in headers if h["name"] == "Subject"), "Club Mail")
+    
+    # Filter by sender
+    is_official = any(email in sender for email in OFFICIAL_CLUB_SENDERS)
+    if not is_official:
         return []
 
+    # internalDate is the send time in epoch ms; yearless dates are read relative to it
+    sent_at = None
+    if msg_data.get("internalDate"):
+        sent_at = datetime.fromtimestamp(int(msg_data["internalDate"]) / 1000, EVENT_TIMEZONE)
+
+    body_text = extract_email_body(payload)
+    links = extract_google_form_links(body_text)
+    details = extract_event_details(body_text, sent_at)
+    
+    if links:
+        print(f"{trace_tag()}Extracted {len(links)} links from message {msg_id}")
+        save_extracted_links(links, msg_id, sender, subject, details, user_email)
+        
+    return links
+
 def sync_historical_mails(user_email=None):
     """
     Search for past emails from official senders and process them.
@@ -119,19 +288,20 @@ def sync_historical_mails(user_email=None):
         try:
             results = service.users().messages().list(userId='me', q=query, maxResults=10).execute()
             messages = results.get('messages', [])
-            
-            for msg_info in messages:
-                msg_id = msg_info['id']
-                if not is_message_processed(msg_id):
-                    links = process_single_message(service, msg_id, user_email)
-                    if links:
-                        total_synced += len(links)
-                    mark_message_processed(msg_id)
         except Exception as e:
             print(f"Error syncing mails for {official_sender}: {e}")
+            continue
+
+        for msg_info in messages:
+            try:
+                total_synced += len(handle_message(service, msg_info['id'], user_email))
+            except Exception:
+                # Failure is recorded on the message; the next sync retries it
+                continue
             
     return total_synced
 
+@traced("save_extracted_links")
 def save_extracted_links(links, msg_id, sender, subject, details, user_email):
     for link in links:
         # Create a unique doc ID to prevent duplicates in Firestore
@@ -148,17 +318,35 @@ def save_extracted_links(links, msg_id, sender, subject, details, user_email):
             if club_query:
                 banner_url = club_query[0].to_dict().get("bannerUrl")
         except Exception as e:
-            print(f"Error fetching club banner for {sender}: {e}")
+            print(f"{trace_tag()}Error fetching club banner for {sender}: {e}")
 
-        doc_ref.set({
-            "link": link,
-            "msg_id": msg_id,
-            "sender": sender,
-            "title": subject,
-            "venue": details.get("venue", "N/A"),
-            "date": details.get("date", "N/A"),
-            "time": details.get("time", "N/A"),
-            "banner_url": banner_url,
-            "recipient": user_email.lower() if user_email else "unknown",
-            "timestamp": firestore.SERVER_TIMESTAMP
-        }, merge=True)
+        event_at = details.get("event_at") or {}
+
+        mail = ClubMail(
+            link=link,
+            msg_id=msg_id,
+            sender=sender,
+            title=subject,
+            recipient=user_email.lower() if user_email else "unknown",
+            venue=details.get("venue", "N/A"),
+            date=details.get("date", "N/A"),
+            time=details.get("time", "N/A"),
+            # Normalized event start, queried by /events/upcoming
+            event_at=event_at.get("timestamp"),
+            event_at_confidence=event_at.get("confidence", 0.0),
+            event_at_raw=event_at.get("raw"),
+            banner_url=banner_url
+        )
+        try:
+            # create() fails if the link was already saved by an earlier,
+            # interrupted attempt, so each entry is written and pushed once
+            doc_ref.create({**mail.to_firestore(), "timestamp": firestore.SERVER_TIMESTAMP})
+        except AlreadyExists:
+            continue
+
+        # Push the committed entry to the user's /club-mails/stream connections,
+        # in UTC like Firestore returns it to /club-mails and /events/upcoming
+        mail.timestamp = datetime.now(timezone.utc)
+        if mail.event_at is not None:
+            mail.event_at = mail.event_at.astimezone(timezone.utc)
+        hub.publish(user_email, mail)
@@ -1,28 +1,55 @@
 from fastapi import APIRouter, Request, BackgroundTasks
-from fastapi.responses import RedirectResponse, JSONResponse
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import RedirectResponse, JSONResponse, StreamingResponse, Response
 from google_auth_oauthlib.flow import Flow
 from googleapiclient.discovery import build
 import json
 import base64
 import os
+import hmac
+import time
+import asyncio
+from datetime import datetime
 
 from .utils import (
-    CLIENT_SECRETS_FILE, SCOPES, REDIRECT_URI,
+    CLIENT_SECRETS_FILE, SCOPES, REDIRECT_URI, EVENT_TIMEZONE,
     get_gmail_service, extract_email_body, extract_google_form_links
 )
 from .gmail_handler import process_gmail_changes, sync_historical_mails, save_history_id
+from . import sharding, profiling
+from .mail_stream import hub, HEARTBEAT_INTERVAL
+from .models import ClubMail, ClubMailResponse, dumps
 from .firebase_config import db
 from firebase_admin import firestore
 
 router = APIRouter()
 
+# A sync scans several senders and can take minutes (the app waits up to 2)
+SYNC_FORWARD_TIMEOUT = 120
+
 @router.post("/auth/google/sync")
 def trigger_sync(request: Request):
     """
     Manually trigger a scan of historical emails for a specific user.
     """
     user_email = request.headers.get("user-email")
-    count = sync_historical_mails(user_email)
+    trace_id = request.headers.get(profiling.TRACE_HEADER) or profiling.new_trace_id()
+
+    # Run the scan on the owning shard, like pushes, so it doesn't compete
+    # for message leases and its mails reach the owner's stream clients
+    if not request.headers.get(sharding.FORWARDED_HEADER) and not sharding.is_local(user_email):
+        result = sharding.forward_to_owner(
+            user_email, "/auth/google/sync",
+            headers={"user-email": user_email, profiling.TRACE_HEADER: trace_id},
+            timeout=SYNC_FORWARD_TIMEOUT
+        )
+        if result is None:
+            return JSONResponse(status_code=503, content={"error": "Owner shard unavailable"})
+        status, content = result
+        return Response(content=content, status_code=status, media_type="application/json")
+
+    with profiling.job("sync_historical_mails", trace_id, user_email=user_email):
+        count = sync_historical_mails(user_email)
     return JSONResponse(content={"status": "success", "synced_links": count})
 
 @router.get("/auth/google/login")
@@ -145,12 +172,25 @@ async def pubsub_gmail_push(request: Request, background_tasks: BackgroundTasks)
         decoded_data = json.loads(base64.b64decode(data_b64).decode("utf-8"))
         history_id = decoded_data.get("historyId")
         email = decoded_data.get("emailAddress")
+        # Follows this push through forwarding and background processing
+        trace_id = request.headers.get(profiling.TRACE_HEADER) or profiling.new_trace_id()
+
+        # Only the shard owning this user processes it, so replicas don't race
+        # on lastHistoryId. Relayed pushes are always handled locally.
+        if history_id and not request.headers.get(sharding.FORWARDED_HEADER) and not sharding.is_local(email):
+            if await run_in_threadpool(sharding.forward_push, email, body, {profiling.TRACE_HEADER: trace_id}):
+                return JSONResponse(status_code=200, content={"status": "forwarded"})
+            # Owner unreachable: nack so Pub/Sub redelivers the push later
+            return JSONResponse(status_code=503, content={"status": "owner unavailable"})
         
         if history_id:
             # Trigger processing in background
-            background_tasks.add_task(process_gmail_changes, history_id, email)
+            background_tasks.add_task(
+                profiling.run_job, "gmail_push", trace_id, process_gmail_changes, history_id, email,
+                user_email=email, queued_at=time.perf_counter()
+            )
             
-        return JSONResponse(status_code=200, content={"status": "acknowledged"})
+        return JSONResponse(status_code=200, content={"status": "acknowledged", "trace_id": trace_id})
     except Exception as e:
         print(f"Error in pubsub endpoint: {e}")
         return JSONResponse(status_code=200, content={"status": "error handled"})
@@ -171,16 +211,132 @@ def get_club_mails(request: Request):
                          .order_by("timestamp", direction=firestore.Query.DESCENDING) \
                          .limit(50)
         
-        docs = query.stream()
-        data = []
-        for doc in docs:
-            mail_data = doc.to_dict()
-            # Convert timestamp to string for JSON serialization
-            if "timestamp" in mail_data and mail_data["timestamp"]:
-                mail_data["timestamp"] = mail_data["timestamp"].isoformat()
-            data.append(mail_data)
-            
-        return JSONResponse(content=data)
+        data = [ClubMail.from_firestore(doc.to_dict()) for doc in query.stream()]
+        return ClubMailResponse(content=data)
     except Exception as e:
         print(f"Error fetching mails from Firestore: {e}")
         return JSONResponse(status_code=500, content={"error": str(e)})
+
+@router.get("/club-mails/stream")
+async def stream_club_mails(request: Request):
+    """
+    Server-Sent Events stream of new club mails for a user.
+
+    Send Last-Event-ID (or ?last_event_id=) on reconnect to resume. Only the
+    last REPLAY_BUFFER_SIZE events per user are kept, in memory: if the
+    server restarted or the client's Last-Event-ID is older than the
+    buffer, a 'reset' event is sent first and the client must reload
+    /club-mails to catch up.
+    """
+    user_email = request.headers.get("user-email")
+    if not user_email:
+        return JSONResponse(status_code=400, content={"error": "user-email header required"})
+
+    # Mails are published on the shard that processes the user's pushes
+    if not sharding.is_local(user_email):
+        owner_url = sharding.ring.nodes[sharding.ring.owner(user_email)]
+        query = f"?{request.url.query}" if request.url.query else ""
+        return RedirectResponse(f"{owner_url}/club-mails/stream{query}", status_code=307)
+
+    last_event_id = request.headers.get("last-event-id") or request.query_params.get("last_event_id")
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        last_event_id = None
+
+    queue, complete = hub.subscribe(user_email, last_event_id)
+
+    async def event_stream():
+        try:
+            yield "retry: 5000\n\n"
+            if not complete:
+                # Some events since Last-Event-ID are gone: reload /club-mails
+                yield "event: reset\ndata: {}\n\n"
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(queue.get(), HEARTBEAT_INTERVAL)
+                except asyncio.TimeoutError:
+                    # Comment line keeps proxies from closing idle connections
+                    yield ": heartbeat\n\n"
+                    continue
+                if event is None:
+                    break
+                event_id, payload = event
+                yield f"id: {event_id}\nevent: club_mail\ndata: {dumps(payload).decode()}\n\n"
+        finally:
+            hub.unsubscribe(user_email, queue)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def _parse_query_datetime(value):
+    """ Parse an ISO 8601 query parameter; naive values are read as campus time. """
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=EVENT_TIMEZONE)
+    return parsed
+
+@router.get("/events/upcoming")
+def get_upcoming_events(request: Request):
+    """
+    Serve club mails whose parsed event time falls in [from, to).
+    'from' defaults to the start of today (campus time), so date-only events
+    stored at midnight still show on their day; 'to' is open-ended when omitted.
+    """
+    user_email = request.headers.get("user-email")
+    if not user_email:
+        return JSONResponse(content=[])
+
+    try:
+        start = request.query_params.get("from")
+        end = request.query_params.get("to")
+        if start:
+            start = _parse_query_datetime(start)
+        else:
+            start = datetime.now(EVENT_TIMEZONE).replace(hour=0, minute=0, second=0, microsecond=0)
+        end = _parse_query_datetime(end) if end else None
+        limit = max(1, min(int(request.query_params.get("limit", 50)), 200))
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": f"Invalid query parameter: {e}"})
+
+    try:
+        # Range query on the indexed event_at field (see firestore.indexes.json)
+        query = db.collection("club_mails").where("recipient", "==", user_email.lower()) \
+                                           .where("event_at", ">=", start)
+        if end:
+            query = query.where("event_at", "<", end)
+        query = query.order_by("event_at").limit(limit)
+
+        data = [ClubMail.from_firestore(doc.to_dict()) for doc in query.stream()]
+        return ClubMailResponse(content=data)
+    except Exception as e:
+        print(f"Error fetching upcoming events from Firestore: {e}")
+        return JSONResponse(status_code=500, content={"error": str(e)})
+
+@router.get("/admin/slow-jobs")
+def get_slow_jobs(request: Request):
+    """
+    List the slowest recent background jobs with their stage breakdown.
+    Requires PROFILING_ENABLED and the ADMIN_TOKEN in an 'admin-token' header.
+    """
+    admin_token = os.getenv("ADMIN_TOKEN")
+    provided = request.headers.get("admin-token", "")
+    if not admin_token or not hmac.compare_digest(provided.encode(), admin_token.encode()):
+        return JSONResponse(status_code=403, content={"error": "Forbidden"})
+
+    try:
+        limit = int(request.query_params.get("limit", 10))
+    except ValueError:
+        limit = 0
+    if limit < 1:
+        return JSONResponse(status_code=400, content={"error": "limit must be a positive integer"})
+    limit = min(limit, profiling.SLOW_JOBS_KEPT)
+
+    return JSONResponse(content={
+        "enabled": profiling.PROFILING_ENABLED,
+        "threshold_ms": profiling.SLOW_JOB_THRESHOLD_MS,
+        "jobs": profiling.slowest_jobs(limit)
+    })
@@ -0,0 +1,105 @@
+import time
+import asyncio
+import threading
+from collections import defaultdict, deque
+
+# Events kept per user so reconnecting clients can resume with Last-Event-ID.
+# The buffer is in memory only and is lost on restart.
+REPLAY_BUFFER_SIZE = 100
+# Undelivered events a single connection may queue before it is dropped
+SUBSCRIBER_QUEUE_SIZE = 100
+HEARTBEAT_INTERVAL = 15
+
+
+class MailStreamHub:
+    """
+    In-process fan-out of new club mails to connected /club-mails/stream clients.
+
+    Writers call publish() from any thread (background tasks run in the
+    threadpool); delivery is handed to the event loop that owns the
+    subscriber queues. Idle connections only cost a parked coroutine and an
+    empty asyncio.Queue, so thousands of them are cheap.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loop = None
+        self._last_id = 0
+        self._subscribers = defaultdict(set)
+        self._history = defaultdict(lambda: deque(maxlen=REPLAY_BUFFER_SIZE))
+        # Ids older than these may have been missed: anything before this
+        # process started, and per user the last event pushed out of the buffer
+        self._started_id = self._next_id()
+        self._evicted_id = {}
+
+    def _next_id(self):
+        # Microsecond clock ids keep increasing across restarts, so a
+        # Last-Event-ID from a previous process never hides new events.
+        self._last_id = max(self._last_id + 1, time.time_ns() // 1000)
+        return self._last_id
+
+    def subscribe(self, user_email, last_event_id=None):
+        """
+        Register a connection and replay buffered events newer than
+        last_event_id. Returns (queue, complete); complete is False when
+        events after last_event_id may no longer be in the buffer.
+        """
+        self._loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        user_email = user_email.lower()
+        complete = True
+        with self._lock:
+            if last_event_id is not None:
+                covered_from = max(self._started_id, self._evicted_id.get(user_email, 0))
+                complete = last_event_id >= covered_from
+                for event in self._history[user_email]:
+                    if event[0] > last_event_id:
+                        self._offer(queue, event)
+            self._subscribers[user_email].add(queue)
+        return queue, complete
+
+    def unsubscribe(self, user_email, queue):
+        user_email = user_email.lower()
+        with self._lock:
+            queues = self._subscribers.get(user_email)
+            if queues is not None:
+                queues.discard(queue)
+                if not queues:
+                    del self._subscribers[user_email]
+
+    def publish(self, user_email, payload):
+        """
+        Fan payload (a ClubMail) out to user_email's connections.
+        Safe to call from any thread.
+        """
+        if not user_email:
+            return
+        user_email = user_email.lower()
+        with self._lock:
+            event = (self._next_id(), payload)
+            history = self._history[user_email]
+            if len(history) == history.maxlen:
+                self._evicted_id[user_email] = history[0][0]
+            history.append(event)
+            has_subscribers = bool(self._subscribers.get(user_email))
+        if has_subscribers and self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._deliver, user_email, event)
+
+    def _deliver(self, user_email, event):
+        with self._lock:
+            queues = list(self._subscribers.get(user_email, ()))
+        for queue in queues:
+            self._offer(queue, event)
+
+    def _offer(self, queue, event):
+        try:
+            queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Slow consumer: end its stream (None) so the client reconnects
+            # and catches up from the replay buffer via Last-Event-ID.
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait(None)
+
+
+hub = MailStreamHub()
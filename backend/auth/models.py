@@ -0,0 +1,76 @@
+from dataclasses import dataclass, fields, MISSING
+from datetime import datetime
+
+import orjson
+from fastapi.responses import JSONResponse
+
+
+@dataclass(slots=True)
+class ClubMail:
+    """
+    One extracted form link, as stored in the 'club_mails' collection.
+    Shared by the writer (save_extracted_links) and the feed endpoints.
+
+    Timestamps are datetimes when written and ISO 8601 strings once loaded
+    for serving (see from_firestore).
+    """
+    link: str
+    msg_id: str
+    sender: str
+    title: str
+    recipient: str
+    venue: str = "N/A"
+    date: str = "N/A"
+    time: str = "N/A"
+    event_at: datetime | str | None = None
+    event_at_confidence: float = 0.0
+    event_at_raw: dict | None = None
+    banner_url: str | None = None
+    # Set by Firestore (SERVER_TIMESTAMP) on write
+    timestamp: datetime | str | None = None
+
+    @classmethod
+    def from_firestore(cls, data: dict) -> "ClubMail":
+        """
+        Build a record from doc.to_dict() for serving. Unknown fields are
+        ignored and missing ones take their defaults. Firestore datetimes are
+        converted to ISO strings here: orjson only serializes exact datetimes
+        natively, and a per-value default() call costs more than isoformat().
+        """
+        mail = cls(*[data.get(name, default) for name, default in _FIELD_DEFAULTS])
+        if mail.timestamp is not None:
+            mail.timestamp = mail.timestamp.isoformat()
+        if mail.event_at is not None:
+            mail.event_at = mail.event_at.isoformat()
+        return mail
+
+    def to_firestore(self) -> dict:
+        """ Document body without timestamp, which the writer sets server-side. """
+        return {name: getattr(self, name) for name in CLUB_MAIL_FIELDS if name != "timestamp"}
+
+
+CLUB_MAIL_FIELDS = ClubMail.__slots__
+_FIELD_DEFAULTS = tuple(
+    (field.name, None if field.default is MISSING else field.default)
+    for field in fields(ClubMail)
+)
+
+
+def _default(obj):
+    # Datetime subclasses (e.g. Firestore's DatetimeWithNanoseconds) that
+    # were not converted by from_firestore
+    if isinstance(obj, datetime):
+        return obj.isoformat()
+    raise TypeError
+
+
+def dumps(content) -> bytes:
+    """ Serialize ClubMail records (or lists of them) straight to JSON bytes. """
+    return orjson.dumps(content, default=_default)
+
+
+class ClubMailResponse(JSONResponse):
+    """ JSONResponse rendered with orjson, which serializes ClubMail slots directly. """
+
+    def render(self, content) -> bytes:
+        return dumps(content)
@@ -0,0 +1,193 @@
+import io
+import os
+import sys
+import time
+import uuid
+import pstats
+import cProfile
+import functools
+import threading
+import traceback
+from collections import deque
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+
+# Opt-in: with profiling off jobs still get trace IDs (for logs) but no timings are kept
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "false").lower() == "true"
+# Jobs slower than this get a profile attached and are kept for /admin/slow-jobs
+SLOW_JOB_THRESHOLD_MS = float(os.getenv("SLOW_JOB_THRESHOLD_MS", "2000"))
+# "stack": dump the job's stack once it crosses the threshold (cheap).
+# "cprofile": run cProfile and keep the stats of slow ones. Only one job is
+# profiled at a time (Python 3.12+ allows a single active profiler, and its
+# stats would include other threads' work anyway); jobs that start while the
+# profiler is busy fall back to the stack dump.
+PROFILE_MODE = os.getenv("PROFILE_MODE", "stack")
+SLOW_JOBS_KEPT = int(os.getenv("SLOW_JOBS_KEPT", "100"))
+
+TRACE_HEADER = "x-trace-id"
+
+_current_job = ContextVar("current_job", default=None)
+_current_trace_id = ContextVar("current_trace_id", default=None)
+_slow_jobs = deque(maxlen=SLOW_JOBS_KEPT)
+_slow_jobs_lock = threading.Lock()
+_profiler_lock = threading.Lock()
+
+
+def new_trace_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+class Job:
+    """ Timings for one unit of background work, e.g. a Gmail push. """
+
+    def __init__(self, name, trace_id, user_email=None):
+        self.name = name
+        self.trace_id = trace_id
+        self.user_email = user_email
+        self.started_at = time.time()
+        self.start = time.perf_counter()
+        self.total_ms = None
+        self.spans = []
+        self.profile = None
+
+    def stages(self) -> dict:
+        """ Total time and call count per span name. """
+        breakdown = {}
+        for name, duration_ms in self.spans:
+            stage = breakdown.setdefault(name, {"ms": 0.0, "count": 0})
+            stage["ms"] = round(stage["ms"] + duration_ms, 2)
+            stage["count"] += 1
+        return breakdown
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "user_email": self.user_email,
+            "started_at": self.started_at,
+            "total_ms": self.total_ms,
+            "stages": self.stages(),
+            "profile": self.profile
+        }
+
+
+def current_trace_id():
+    return _current_trace_id.get()
+
+
+def trace_tag() -> str:
+    """ Log prefix tying a line to the current job, e.g. "[trace 3f2a...] ". """
+    trace_id = current_trace_id()
+    return f"[trace {trace_id}] " if trace_id else ""
+
+
+@contextmanager
+def job(name, trace_id=None, user_email=None, queued_at=None):
+    """
+    Time a background job. Spans opened inside it (see span/traced) are
+    attributed to it, and it is sampled if slower than SLOW_JOB_THRESHOLD_MS.
+    queued_at is a perf_counter() value from when the work was enqueued.
+    """
+    trace_id = trace_id or new_trace_id()
+    trace_token = _current_trace_id.set(trace_id)
+    if not PROFILING_ENABLED:
+        try:
+            yield None
+        finally:
+            _current_trace_id.reset(trace_token)
+        return
+
+    current = Job(name, trace_id, user_email)
+    if queued_at is not None:
+        current.spans.append(("queue_wait", (current.start - queued_at) * 1000))
+    token = _current_job.set(current)
+
+    profiler = None
+    watchdog = None
+    try:
+        if PROFILE_MODE == "cprofile" and _profiler_lock.acquire(blocking=False):
+            try:
+                profiler = cProfile.Profile()
+                profiler.enable()
+            except Exception as e:
+                # e.g. ValueError when another tool already holds the profiler
+                print(f"Could not start profiler for {name} [{trace_id}]: {e}")
+                profiler = None
+                _profiler_lock.release()
+        if profiler is None:
+            thread_id = threading.get_ident()
+            watchdog = threading.Timer(SLOW_JOB_THRESHOLD_MS / 1000, _dump_stack, (current, thread_id))
+            watchdog.daemon = True
+            watchdog.start()
+
+        yield current
+    finally:
+        if profiler:
+            profiler.disable()
+            _profiler_lock.release()
+        if watchdog:
+            watchdog.cancel()
+        _current_job.reset(token)
+        _current_trace_id.reset(trace_token)
+        current.total_ms = round((time.perf_counter() - current.start) * 1000, 2)
+
+        if current.total_ms >= SLOW_JOB_THRESHOLD_MS:
+            if profiler:
+                out = io.StringIO()
+                pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(25)
+                current.profile = out.getvalue()
+            print(f"Slow job {name} [{current.trace_id}] took {current.total_ms} ms: {current.stages()}")
+            with _slow_jobs_lock:
+                _slow_jobs.append(current)
+
+
+def _dump_stack(current, thread_id):
+    frame = sys._current_frames().get(thread_id)
+    if frame is not None:
+        current.profile = "".join(traceback.format_stack(frame))
+
+
+class _Span:
+    __slots__ = ("job", "name", "start")
+
+    def __init__(self, job, name):
+        self.job = job
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.job.spans.append((self.name, (time.perf_counter() - self.start) * 1000))
+
+
+def span(name):
+    """ Time a stage of the current job; a no-op outside a profiled job. """
+    current = _current_job.get()
+    if current is None:
+        return nullcontext()
+    return _Span(current, name)
+
+
+def traced(name):
+    """ Decorator form of span(). """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def run_job(name, trace_id, fn, *args, user_email=None, queued_at=None, **kwargs):
+    """ Run fn(*args, **kwargs) as a profiled job; for use with BackgroundTasks. """
+    with job(name, trace_id, user_email, queued_at):
+        return fn(*args, **kwargs)
+
+
+def slowest_jobs(limit=10) -> list:
+    with _slow_jobs_lock:
+        jobs = list(_slow_jobs)
+    jobs.sort(key=lambda j: j.total_ms, reverse=True)
+    return [j.to_dict() for j in jobs[:limit]]
@@ -0,0 +1,126 @@
+import os
+import json
+import bisect
+import hashlib
+import urllib.error
+import urllib.request
+
+# Shard membership, e.g. "node-a=http://10.0.0.1:8000,node-b=http://10.0.0.2:8000".
+# When unset the process owns every user (single-node deployment).
+SHARD_NODES = os.getenv("SHARD_NODES", "")
+SHARD_NODE_ID = os.getenv("SHARD_NODE_ID", "")
+# Virtual nodes per member; more points give a more even spread of users
+SHARD_VNODES = int(os.getenv("SHARD_VNODES", "128"))
+FORWARD_TIMEOUT = 10
+
+# Set on pushes relayed by another shard so they are never forwarded twice
+FORWARDED_HEADER = "x-shard-forwarded-by"
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.md5(key.encode("utf-8")).digest()[:8], "big")
+
+
+class HashRing:
+    """
+    Consistent hash ring mapping user emails to shard nodes.
+
+    Each node is placed on the ring at `vnodes` points; a key belongs to the
+    first point clockwise from its hash. Adding or removing a node therefore
+    only moves the keys adjacent to that node's points (about 1/N of users).
+    """
+
+    def __init__(self, nodes=None, vnodes=SHARD_VNODES):
+        self.vnodes = vnodes
+        self.nodes = {}
+        self._points = []
+        self._owners = []
+        for node_id, url in (nodes or {}).items():
+            self.add_node(node_id, url)
+
+    def add_node(self, node_id, url):
+        self.nodes[node_id] = url
+        self._rebuild()
+
+    def remove_node(self, node_id):
+        self.nodes.pop(node_id, None)
+        self._rebuild()
+
+    def _rebuild(self):
+        ring = sorted(
+            (_hash(f"{node_id}#{i}"), node_id)
+            for node_id in self.nodes
+            for i in range(self.vnodes)
+        )
+        self._points = [point for point, _ in ring]
+        self._owners = [node_id for _, node_id in ring]
+
+    def owner(self, key):
+        """ Return the node id owning key, or None if the ring is empty. """
+        if not self._points:
+            return None
+        index = bisect.bisect(self._points, _hash(key.lower()))
+        return self._owners[index % len(self._owners)]
+
+
+def parse_nodes(spec: str) -> dict:
+    """ Parse "id=url,id=url" into {id: url}. """
+    nodes = {}
+    for entry in spec.split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        node_id, _, url = entry.partition("=")
+        nodes[node_id.strip()] = url.strip().rstrip("/")
+    return nodes
+
+
+ring = HashRing(parse_nodes(SHARD_NODES))
+
+
+def is_local(user_email) -> bool:
+    """ True if this process should handle user_email's pushes. """
+    if not user_email or not ring.nodes or not SHARD_NODE_ID:
+        return True
+    return ring.owner(user_email) == SHARD_NODE_ID
+
+
+def forward_to_owner(user_email, path, body=None, headers=None, timeout=FORWARD_TIMEOUT):
+    """
+    POST body (JSON) to path on the shard owning user_email.
+    Returns (status, response bytes), or None if the owner could not be reached.
+    """
+    owner = ring.owner(user_email)
+    url = ring.nodes.get(owner)
+    if not url:
+        return None
+
+    request = urllib.request.Request(
+        f"{url}{path}",
+        data=json.dumps(body or {}).encode("utf-8"),
+        headers={
+            "Content-Type": "application/json",
+            FORWARDED_HEADER: SHARD_NODE_ID,
+            **(headers or {})
+        },
+        method="POST"
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return response.status, response.read()
+    except urllib.error.HTTPError as e:
+        # The owner answered; pass its error through
+        return e.code, e.read()
+    except Exception as e:
+        print(f"Error forwarding {path} for {user_email} to shard {owner}: {e}")
+        return None
+
+
+def forward_push(user_email, body: dict, headers=None) -> bool:
+    """
+    Relay a Pub/Sub push body to the shard owning user_email.
+    Returns False if the owner could not be reached, so the caller can nack
+    the push and let Pub/Sub redeliver it.
+    """
+    result = forward_to_owner(user_email, "/pubsub/gmail", body, headers)
+    return result is not None and 200 <= result[0] < 300
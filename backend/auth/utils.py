@@ -2,6 +2,7 @@ import os
 import json
 import base64
 import re
+from datetime import datetime, timedelta, timezone
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import Flow
 from google.auth.transport.requests import Request as GoogleRequest
@@ -99,9 +100,11 @@ def extract_google_form_links(text: str) -> list[str]:
         return []
     return GOOGLE_FORM_REGEX.findall(text)
 
-def extract_event_details(text: str) -> dict:
+def extract_event_details(text: str, reference: datetime = None) -> dict:
     """
-    Extract Venue, Date, and Time from the email body.
+    Extract Venue, Date, and Time from the email body, plus the parsed
+    event timestamp (see parse_event_datetime) under "event_at".
+    reference is when the mail was sent, used to infer missing years.
     """
     details = {
         "venue": "N/A",
@@ -109,6 +112,7 @@ def extract_event_details(text: str) -> dict:
         "time": "N/A"
     }
     if not text:
+        details["event_at"] = parse_event_datetime("", "", reference)
         return details
         
     venue_match = VENUE_REGEX.search(text)
@@ -121,9 +125,145 @@ def extract_event_details(text: str) -> dict:
         details["date"] = date_match.group(1).strip()
     if time_match:
         details["time"] = time_match.group(1).strip()
-        
+
+    details["event_at"] = parse_event_datetime(details["date"], details["time"], reference)
     return details
 
+# Club mails are written for the VIT-AP campus, so times without an explicit
+# zone are read as IST.
+EVENT_TIMEZONE = timezone(timedelta(hours=5, minutes=30))
+
+MONTHS = {
+    "jan": 1, "feb": 2, "mar": 3, "apr": 4, "may": 5, "jun": 6,
+    "jul": 7, "aug": 8, "sep": 9, "oct": 10, "nov": 11, "dec": 12
+}
+_MONTH = r"(jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[a-z]*\.?"
+_DAY = r"(\d{1,2})(?:st|nd|rd|th)?"
+_YEAR = r"(?:,?\s*(\d{4}))?"
+# Multi-day events ("1st-3rd March", "March 1-3") are stored at their first day
+_RANGE_START = r"(?:(\d{1,2})(?:st|nd|rd|th)?\s*(?:-|–|to)\s*)?"
+_RANGE_END = r"(?:\s*(?:-|–|to)\s*\d{1,2}(?:st|nd|rd|th)?)?"
+
+ISO_DATE_REGEX = re.compile(r"\b(\d{4})-(\d{1,2})-(\d{1,2})\b")
+NUMERIC_DATE_REGEX = re.compile(r"\b(\d{1,2})[/.\-](\d{1,2})[/.\-](\d{2,4})\b")
+DAY_MONTH_REGEX = re.compile(r"(?i)\b" + _RANGE_START + _DAY + r"\s*(?:of\s+)?" + _MONTH + _YEAR)
+MONTH_DAY_REGEX = re.compile(r"(?i)\b" + _MONTH + r"\s+" + _DAY + _RANGE_END + r"\b" + _YEAR)
+# The meridiem must end the word, so "10 amphitheatre" is not 10 AM
+CLOCK_REGEX = re.compile(r"(?i)\b(\d{1,2})(?:[:.](\d{2}))?\s*(?:(a\.?m\.?|p\.?m\.?)(?![a-z]))?(?![\d/])")
+
+def _parse_date(text: str, reference: datetime):
+    """
+    Return (date, year_given, rest) for the first date found in text, where
+    rest is text with the date removed, or (None, False, text).
+    Numeric dates are read day-first, as they are written on campus.
+    """
+    day = month = year = None
+    match = ISO_DATE_REGEX.search(text)
+    if match:
+        year, month, day = (int(g) for g in match.groups())
+    else:
+        match = NUMERIC_DATE_REGEX.search(text)
+        if match:
+            day, month, year = (int(g) for g in match.groups())
+            if year < 100:
+                year += 2000
+        else:
+            match = DAY_MONTH_REGEX.search(text)
+            if match:
+                day = int(match.group(1) or match.group(2))
+                month = MONTHS[match.group(3).lower()[:3]]
+                year = int(match.group(4)) if match.group(4) else None
+            else:
+                match = MONTH_DAY_REGEX.search(text)
+                if match:
+                    month = MONTHS[match.group(1).lower()[:3]]
+                    day = int(match.group(2))
+                    year = int(match.group(3)) if match.group(3) else None
+
+    if day is None:
+        return None, False, text
+
+    # So "12.03.2026" is not read again as the time 12:03
+    rest = text[:match.start()] + " " + text[match.end():]
+
+    if year is not None:
+        try:
+            return datetime(year, month, day).date(), True, rest
+        except ValueError:
+            return None, False, text
+
+    # Mails announce upcoming events: a yearless date that is already well in
+    # the past refers to a later year (for 29th Feb, the next leap year).
+    earliest = reference.replace(tzinfo=None) - timedelta(days=180)
+    for year in range(reference.year, reference.year + 9):
+        try:
+            candidate = datetime(year, month, day)
+        except ValueError:
+            continue
+        if candidate >= earliest:
+            return candidate.date(), False, rest
+    return None, False, text
+
+def _parse_time(text: str):
+    """
+    Return (hour, minute) for the first clock time found in text, or None.
+    For ranges like "10 AM - 12 PM" the start time is used.
+    """
+    for match in CLOCK_REGEX.finditer(text):
+        hour = int(match.group(1))
+        minute = int(match.group(2) or 0)
+        meridiem = (match.group(3) or "").replace(".", "").lower()
+        # A bare number is only a time if it was written as HH:MM
+        if not meridiem and match.group(2) is None:
+            continue
+        if meridiem:
+            if not 1 <= hour <= 12:
+                continue
+            hour = hour % 12 + (12 if meridiem == "pm" else 0)
+        if hour > 23 or minute > 59:
+            continue
+        return hour, minute
+    return None
+
+def parse_event_datetime(date_text: str, time_text: str, reference: datetime = None) -> dict:
+    """
+    Normalize the free-text Date/Time fields of a club mail into a timestamp.
+
+    Returns {"timestamp", "confidence", "raw"}. timestamp is a timezone-aware
+    datetime (None if no date could be found) and confidence is between 0 and 1:
+    1.0 for an explicit date, year and time, lower when the year was inferred or
+    the time was missing. The original text is always kept in raw.
+    """
+    date_text = date_text if date_text and date_text != "N/A" else ""
+    time_text = time_text if time_text and time_text != "N/A" else ""
+    result = {
+        "timestamp": None,
+        "confidence": 0.0,
+        "raw": {"date": date_text or "N/A", "time": time_text or "N/A"}
+    }
+    reference = reference or datetime.now(EVENT_TIMEZONE)
+
+    event_date, year_given, date_rest = _parse_date(date_text, reference)
+    if not event_date:
+        return result
+
+    # Some mails put everything on one line, e.g. "Date: 12th March, 2 PM"
+    clock = _parse_time(time_text) or _parse_time(date_rest)
+    hour, minute = clock or (0, 0)
+
+    confidence = 1.0
+    if not year_given:
+        confidence -= 0.2
+    if not clock:
+        confidence -= 0.4
+
+    result["timestamp"] = datetime(
+        event_date.year, event_date.month, event_date.day, hour, minute,
+        tzinfo=EVENT_TIMEZONE
+    )
+    result["confidence"] = round(confidence, 2)
+    return result
+
 def get_gmail_service(user_email=None):
     if not user_email:
         # Fallback to legacy token.json if no user_email provided
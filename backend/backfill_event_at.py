@@ -0,0 +1,40 @@
+"""
+One-off backfill of event_at for club_mails saved before dates were parsed.
+
+Documents without an event_at field are invisible to /events/upcoming. This
+parses their stored Date/Time text, reading yearless dates relative to when
+the mail was saved, and writes event_at, event_at_confidence and event_at_raw.
+
+    python backfill_event_at.py [--dry-run]
+"""
+import argparse
+
+from auth.firebase_config import db
+from auth.utils import parse_event_datetime
+
+
+def backfill(dry_run=False):
+    updated = 0
+    for doc in db.collection("club_mails").stream():
+        data = doc.to_dict()
+        if "event_at" in data:
+            continue
+
+        event_at = parse_event_datetime(data.get("date", "N/A"), data.get("time", "N/A"), data.get("timestamp"))
+        print(f"{doc.id}: {event_at['raw']} -> {event_at['timestamp']} ({event_at['confidence']})")
+        if not dry_run:
+            doc.reference.update({
+                "event_at": event_at["timestamp"],
+                "event_at_confidence": event_at["confidence"],
+                "event_at_raw": event_at["raw"]
+            })
+        updated += 1
+    return updated
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill event_at on existing club_mails")
+    parser.add_argument("--dry-run", action="store_true", help="Print parsed values without writing")
+    args = parser.parse_args()
+    count = backfill(args.dry_run)
+    print(f"{'Would update' if args.dry_run else 'Updated'} {count} documents")
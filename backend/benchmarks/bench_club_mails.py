@@ -0,0 +1,101 @@
+"""
+Micro-benchmark for serving the /club-mails feed.
+
+Compares the previous path (to_dict + isoformat per document, rendered by the
+stdlib-based JSONResponse) with ClubMail records rendered by ClubMailResponse,
+for 50-, 500- and 5000-item feeds. Reports per request: CPU time, peak traced
+memory, and the number of memory blocks the request built (records or dicts,
+strings and the rendered body).
+
+    cd backend && python benchmarks/bench_club_mails.py
+"""
+import os
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from fastapi.responses import JSONResponse
+from auth.models import ClubMail, ClubMailResponse
+
+FEED_SIZES = (50, 500, 5000)
+ROUNDS = 20
+
+
+class FirestoreDatetime(datetime):
+    """ Stand-in for Firestore's DatetimeWithNanoseconds subclass. """
+
+
+def make_documents(count):
+    now = datetime.now(timezone.utc)
+    docs = []
+    for i in range(count):
+        docs.append({
+            "link": f"https://forms.gle/example{i}",
+            "msg_id": f"18c{i:013x}",
+            "sender": "asstdir.cac@vitap.ac.in",
+            "title": f"Club event #{i}: registrations open",
+            "recipient": "student@vitapstudent.ac.in",
+            "venue": "Auditorium, Block C",
+            "date": "12th March",
+            "time": "2 PM",
+            "event_at": FirestoreDatetime.fromtimestamp(now.timestamp() + i * 3600, timezone.utc),
+            "event_at_confidence": 0.8,
+            "event_at_raw": {"date": "12th March", "time": "2 PM"},
+            "banner_url": None,
+            "timestamp": FirestoreDatetime.fromtimestamp((now - timedelta(minutes=i)).timestamp(), timezone.utc),
+        })
+    return docs
+
+
+def legacy_path(docs):
+    data = []
+    for doc in docs:
+        mail_data = dict(doc)  # doc.to_dict() returns a fresh dict
+        for field in ("timestamp", "event_at"):
+            if mail_data.get(field):
+                mail_data[field] = mail_data[field].isoformat()
+        data.append(mail_data)
+    return data, JSONResponse(content=data).body
+
+
+def record_path(docs):
+    data = [ClubMail.from_firestore(dict(doc)) for doc in docs]
+    return data, ClubMailResponse(content=data).body
+
+
+def measure(path, docs):
+    path(docs)  # warm up
+    start = time.process_time()
+    for _ in range(ROUNDS):
+        _, body = path(docs)
+    cpu_ms = (time.process_time() - start) / ROUNDS * 1000
+
+    # Diff snapshots around one call while its result (the response body and
+    # the records/dicts built for it) is still alive, so the count covers the
+    # blocks the request allocated rather than what survives it.
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    tracemalloc.reset_peak()
+    result = path(docs)
+    _, peak = tracemalloc.get_traced_memory()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    blocks = sum(max(stat.count_diff, 0) for stat in after.compare_to(before, "lineno"))
+    del result
+    return cpu_ms, peak, blocks, len(body)
+
+
+def main():
+    print(f"{'items':>6} {'path':<8} {'cpu ms/req':>11} {'peak KiB':>9} {'alloc blocks':>12} {'bytes':>9}")
+    for size in FEED_SIZES:
+        docs = make_documents(size)
+        for name, path in (("legacy", legacy_path), ("record", record_path)):
+            cpu_ms, peak, blocks, length = measure(path, docs)
+            print(f"{size:>6} {name:<8} {cpu_ms:>11.3f} {peak / 1024:>9.1f} {blocks:>12} {length:>9}")
+
+
+if __name__ == "__main__":
+    main()
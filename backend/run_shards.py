@@ -0,0 +1,44 @@
+"""
+Run several sharded backend workers on one host.
+
+    python run_shards.py --workers 4 --base-port 8001
+
+Each worker is a separate uvicorn process with its own SHARD_NODE_ID; all of
+them share the same SHARD_NODES list, so any worker can receive a Pub/Sub
+push and relay it to the worker owning that user.
+"""
+import os
+import sys
+import argparse
+import subprocess
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run sharded ClubStars backend workers")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--base-port", type=int, default=8001)
+    args = parser.parse_args()
+
+    ports = [args.base_port + i for i in range(args.workers)]
+    nodes = ",".join(f"worker-{i}=http://{args.host}:{port}" for i, port in enumerate(ports))
+
+    processes = []
+    for i, port in enumerate(ports):
+        env = dict(os.environ, SHARD_NODES=nodes, SHARD_NODE_ID=f"worker-{i}")
+        processes.append(subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--host", args.host, "--port", str(port)],
+            env=env
+        ))
+        print(f"Started worker-{i} on port {port}")
+
+    try:
+        for process in processes:
+            process.wait()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.terminate()
+
+
+if __name__ == "__main__":
+    main()
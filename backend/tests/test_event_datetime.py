@@ -0,0 +1,48 @@
+from datetime import datetime
+
+import pytest
+
+from auth.utils import EVENT_TIMEZONE, parse_event_datetime
+
+REFERENCE = datetime(2026, 10, 19, 12, 0, tzinfo=EVENT_TIMEZONE)
+
+
+def ist(*args):
+    return datetime(*args, tzinfo=EVENT_TIMEZONE)
+
+
+@pytest.mark.parametrize("date_text, time_text, expected, confidence", [
+    # Dotted day-first dates must not be read as a clock time
+    ("12.03.2026", "N/A", ist(2026, 3, 12, 0, 0), 0.6),
+    ("12.03.26", "N/A", ist(2026, 3, 12, 0, 0), 0.6),
+    ("12/03/2026", "10:30 AM", ist(2026, 3, 12, 10, 30), 1.0),
+    ("2026-11-02", "5 PM onwards", ist(2026, 11, 2, 17, 0), 1.0),
+    # Ranges use the start time
+    ("25th October 2026", "10 AM - 12 PM", ist(2026, 10, 25, 10, 0), 1.0),
+    ("25th October 2026", "14:00 - 16:00", ist(2026, 10, 25, 14, 0), 1.0),
+    # Multi-day events use the first day
+    ("1st-3rd March 2027", "N/A", ist(2027, 3, 1, 0, 0), 0.6),
+    ("1 - 3 March 2027", "10 AM", ist(2027, 3, 1, 10, 0), 1.0),
+    ("March 1-3, 2027", "N/A", ist(2027, 3, 1, 0, 0), 0.6),
+    ("March 1st–3rd", "N/A", ist(2027, 3, 1, 0, 0), 0.4),
+    # "am"/"pm" inside a word is not a meridiem
+    ("12th March 2027", "Room 10 amphitheatre", ist(2027, 3, 12, 0, 0), 0.6),
+    ("12th March 2027, Room 4 pmr hall", "N/A", ist(2027, 3, 12, 0, 0), 0.6),
+    # Time written on the Date line
+    ("12th Nov, 2 PM", "N/A", ist(2026, 11, 12, 14, 0), 0.8),
+    # Yearless dates: this year, or next year once well in the past
+    ("Nov 3rd", "4.30 pm", ist(2026, 11, 3, 16, 30), 0.8),
+    ("12th March", "9 a.m.", ist(2027, 3, 12, 9, 0), 0.8),
+    ("5th January", "N/A", ist(2027, 1, 5, 0, 0), 0.4),
+    # 29th Feb without a year resolves to the next leap year
+    ("29th February", "N/A", ist(2028, 2, 29, 0, 0), 0.4),
+    # Nothing to parse
+    ("N/A", "N/A", None, 0.0),
+    ("To be announced", "3 PM", None, 0.0),
+    ("31/02/2026", "N/A", None, 0.0),
+])
+def test_parse_event_datetime(date_text, time_text, expected, confidence):
+    result = parse_event_datetime(date_text, time_text, REFERENCE)
+    assert result["timestamp"] == expected
+    assert result["confidence"] == confidence
+    assert result["raw"] == {"date": date_text, "time": time_text}
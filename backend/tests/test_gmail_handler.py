@@ -0,0 +1,321 @@
+import sys
+import types
+from datetime import datetime, timedelta, timezone
+
+import httplib2
+import pytest
+from google.api_core.exceptions import AlreadyExists, ServiceUnavailable
+from googleapiclient.errors import HttpError
+
+# gmail_handler imports the shared Firestore client, which needs credentials;
+# the tests swap in FakeFirestore below instead.
+sys.modules.setdefault("auth.firebase_config", types.ModuleType("auth.firebase_config"))
+sys.modules["auth.firebase_config"].db = None
+
+from auth import gmail_handler  # noqa: E402
+
+USER = "student@vitapstudent.ac.in"
+
+
+class FakeSnapshot:
+    def __init__(self, data):
+        self._data = data
+        self.exists = data is not None
+
+    def to_dict(self):
+        return dict(self._data) if self._data is not None else None
+
+
+class FakeDocument:
+    def __init__(self, store, key):
+        self.store = store
+        self.key = key
+
+    def get(self, transaction=None):
+        return FakeSnapshot(self.store.get(self.key))
+
+    def set(self, data, merge=False):
+        if merge and self.key in self.store:
+            self.store[self.key] = {**self.store[self.key], **data}
+        else:
+            self.store[self.key] = dict(data)
+
+    def create(self, data):
+        if self.key in self.store:
+            raise AlreadyExists(f"{self.key} exists")
+        self.store[self.key] = dict(data)
+
+
+class FakeCollection:
+    def __init__(self, store, name):
+        self.store = store
+        self.name = name
+
+    def document(self, doc_id):
+        return FakeDocument(self.store, (self.name, doc_id))
+
+    def where(self, *args):
+        return self
+
+    def limit(self, count):
+        return self
+
+    def get(self):
+        return []
+
+
+class FakeTransaction:
+    def set(self, ref, data, merge=False):
+        ref.set(data, merge)
+
+
+class FakeFirestore:
+    def __init__(self):
+        self.store = {}
+
+    def collection(self, name):
+        return FakeCollection(self.store, name)
+
+    def transaction(self):
+        return FakeTransaction()
+
+    def docs(self, collection):
+        return {key[1]: data for key, data in self.store.items() if key[0] == collection}
+
+
+class FakeHub:
+    def __init__(self):
+        self.published = []
+
+    def publish(self, user_email, mail):
+        self.published.append((user_email, mail))
+
+
+class FakeRequest:
+    def __init__(self, result):
+        self.result = result
+
+    def execute(self):
+        if isinstance(self.result, Exception):
+            raise self.result
+        return self.result
+
+
+class FakeGmail:
+    """ Just enough of the Gmail client for history().list / messages().get. """
+
+    def __init__(self, history=None, messages=None, history_error=None):
+        self._history = history or []
+        self._messages = messages or {}
+        self._history_error = history_error
+
+    def users(self):
+        return self
+
+    def history(self):
+        return self
+
+    def messages(self):
+        return self
+
+    def list(self, **kwargs):
+        if self._history_error:
+            return FakeRequest(self._history_error)
+        return FakeRequest({"history": self._history, "historyId": "500"})
+
+    def get(self, userId, id, format):
+        return FakeRequest(self._messages.get(id, http_error(404)))
+
+
+def http_error(status):
+    return HttpError(httplib2.Response({"status": status}), b"")
+
+
+def club_mail(link="https://forms.gle/abc"):
+    return {
+        "internalDate": "1792400000000",
+        "payload": {
+            "headers": [
+                {"name": "From", "value": "CAC <asstdir.cac@vitap.ac.in>"},
+                {"name": "Subject", "value": "Hackathon"}
+            ],
+            "body": {"data": ""},
+            "parts": [{
+                "mimeType": "text/plain",
+                "body": {"data": _b64(f"Register: {link}\nDate: 12th March\nTime: 2 PM")}
+            }]
+        }
+    }
+
+
+def _b64(text):
+    import base64
+    return base64.urlsafe_b64encode(text.encode()).decode()
+
+
+@pytest.fixture
+def db(monkeypatch):
+    fake = FakeFirestore()
+    monkeypatch.setattr(gmail_handler, "db", fake)
+    monkeypatch.setattr(gmail_handler.firestore, "transactional", lambda fn: fn)
+    return fake
+
+
+@pytest.fixture
+def hub(monkeypatch):
+    fake = FakeHub()
+    monkeypatch.setattr(gmail_handler, "hub", fake)
+    return fake
+
+
+def failing(error, calls):
+    def process(service, msg_id, user_email):
+        calls.append(msg_id)
+        raise error
+    return process
+
+
+def test_poison_message_is_dead_lettered_after_max_attempts(db, monkeypatch):
+    calls = []
+    monkeypatch.setattr(gmail_handler, "process_single_message", failing(ValueError("bad body"), calls))
+
+    for _ in range(gmail_handler.MAX_MESSAGE_ATTEMPTS - 1):
+        with pytest.raises(ValueError):
+            gmail_handler.handle_message(None, "m1", USER)
+        assert "m1" not in db.docs("dead_letters")
+
+    assert gmail_handler.handle_message(None, "m1", USER) == []
+    dead = db.docs("dead_letters")["m1"]
+    assert dead["attempts"] == gmail_handler.MAX_MESSAGE_ATTEMPTS
+    assert "bad body" in dead["error"]
+    assert db.docs("processed_messages")["m1"]["state"] == "dead_letter"
+
+    # Quarantined messages are not retried
+    assert gmail_handler.handle_message(None, "m1", USER) == []
+    assert len(calls) == gmail_handler.MAX_MESSAGE_ATTEMPTS
+
+
+@pytest.mark.parametrize("error", [http_error(503), http_error(429), ServiceUnavailable("down"), TimeoutError()])
+def test_transient_errors_do_not_use_up_attempts(db, hub, monkeypatch, error):
+    calls = []
+    monkeypatch.setattr(gmail_handler, "process_single_message", failing(error, calls))
+
+    for _ in range(gmail_handler.MAX_MESSAGE_ATTEMPTS + 2):
+        with pytest.raises(type(error)):
+            gmail_handler.handle_message(None, "m1", USER)
+    marker = db.docs("processed_messages")["m1"]
+    assert marker["attempts"] == 0
+    assert marker["state"] == "failed"
+    assert "m1" not in db.docs("dead_letters")
+
+    # Once the outage is over the message goes through
+    monkeypatch.setattr(gmail_handler, "process_single_message", lambda service, msg_id, user_email: ["link"])
+    assert gmail_handler.handle_message(None, "m1", USER) == ["link"]
+    assert db.docs("processed_messages")["m1"]["state"] == "done"
+
+
+def test_deleted_message_is_skipped(db, hub):
+    service = FakeGmail(messages={})
+    assert gmail_handler.handle_message(service, "gone", USER) == []
+    marker = db.docs("processed_messages")["gone"]
+    assert marker["state"] == "skipped"
+    assert marker["processed"] is True
+    assert "gone" not in db.docs("dead_letters")
+
+
+def test_retry_after_interrupted_save_writes_and_publishes_once(db, hub, monkeypatch):
+    service = FakeGmail(messages={"m1": club_mail()})
+    real_process = gmail_handler.process_single_message
+    attempts = []
+
+    def crash_after_save(service, msg_id, user_email):
+        links = real_process(service, msg_id, user_email)
+        attempts.append(msg_id)
+        if len(attempts) == 1:
+            raise ConnectionError("worker lost connection after saving")
+        return links
+
+    monkeypatch.setattr(gmail_handler, "process_single_message", crash_after_save)
+
+    with pytest.raises(ConnectionError):
+        gmail_handler.handle_message(service, "m1", USER)
+    gmail_handler.handle_message(service, "m1", USER)
+
+    assert len(attempts) == 2
+    assert len(db.docs("club_mails")) == 1
+    assert len(hub.published) == 1
+    mail = hub.published[0][1]
+    assert mail.link == "https://forms.gle/abc"
+    assert mail.event_at.utcoffset() == timedelta(0)
+    assert db.docs("processed_messages")["m1"]["state"] == "done"
+
+
+def test_live_lease_is_busy_and_expired_lease_is_reclaimed(db):
+    gmail_handler.claim_message("m1")
+    with pytest.raises(gmail_handler.MessageBusy):
+        gmail_handler.claim_message("m1")
+
+    # The holder crashed: once its lease expires another worker takes over
+    key = ("processed_messages", "m1")
+    db.store[key]["lease_until"] = datetime.now(timezone.utc) - timedelta(seconds=1)
+    assert gmail_handler.claim_message("m1") is True
+    assert db.store[key]["attempts"] == 2
+
+    gmail_handler.mark_message_processed("m1")
+    assert gmail_handler.claim_message("m1") is False
+
+
+def test_legacy_processed_marker_is_honoured(db):
+    db.collection("processed_messages").document("old").set({"processed": True})
+    assert gmail_handler.claim_message("old") is False
+
+
+def test_history_checkpoint_only_moves_forward(db):
+    gmail_handler.save_history_id(USER, "100")
+    gmail_handler.advance_history_id(USER, "150")
+    gmail_handler.advance_history_id(USER, "120")
+    assert gmail_handler.get_last_history_id(USER) == "150"
+
+
+def test_scan_skips_deleted_message_and_processes_the_rest(db, hub, monkeypatch):
+    service = FakeGmail(
+        history=[
+            {"id": "101", "messagesAdded": [{"message": {"id": "gone"}}]},
+            {"id": "102", "messagesAdded": [{"message": {"id": "m1"}}]}
+        ],
+        messages={"m1": club_mail()}
+    )
+    monkeypatch.setattr(gmail_handler, "get_gmail_service", lambda user_email: service)
+    gmail_handler.save_history_id(USER, "100")
+
+    assert gmail_handler.process_gmail_changes("500", USER) == ["https://forms.gle/abc"]
+    assert gmail_handler.get_last_history_id(USER) == "500"
+    assert db.docs("processed_messages")["gone"]["state"] == "skipped"
+    assert db.docs("processed_messages")["m1"]["state"] == "done"
+
+
+def test_scan_stops_at_failed_message(db, hub, monkeypatch):
+    service = FakeGmail(
+        history=[
+            {"id": "101", "messagesAdded": [{"message": {"id": "m1"}}]},
+            {"id": "102", "messagesAdded": [{"message": {"id": "m2"}}]},
+            {"id": "103", "messagesAdded": [{"message": {"id": "m3"}}]}
+        ],
+        messages={"m1": club_mail("https://forms.gle/1"), "m2": http_error(503), "m3": club_mail("https://forms.gle/3")}
+    )
+    monkeypatch.setattr(gmail_handler, "get_gmail_service", lambda user_email: service)
+    gmail_handler.save_history_id(USER, "100")
+
+    assert gmail_handler.process_gmail_changes("500", USER) == ["https://forms.gle/1"]
+    # Checkpoint stays before m2 so the next push resumes there
+    assert gmail_handler.get_last_history_id(USER) == "101"
+    assert "m3" not in db.docs("processed_messages")
+
+
+def test_expired_history_resets_watermark(db, monkeypatch):
+    service = FakeGmail(history_error=http_error(404))
+    monkeypatch.setattr(gmail_handler, "get_gmail_service", lambda user_email: service)
+    gmail_handler.save_history_id(USER, "1")
+
+    assert gmail_handler.process_gmail_changes("900", USER) == []
+    assert gmail_handler.get_last_history_id(USER) == "900"
@@ -0,0 +1,127 @@
+import asyncio
+import threading
+
+from auth import mail_stream
+from auth.mail_stream import MailStreamHub
+
+USER = "student@vitapstudent.ac.in"
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def drain(queue):
+    events = []
+    while not queue.empty():
+        events.append(queue.get_nowait())
+    return events
+
+
+def test_publish_reaches_subscribers_from_other_threads():
+    async def scenario():
+        hub = MailStreamHub()
+        queue, complete = hub.subscribe(USER)
+        assert complete
+
+        thread = threading.Thread(target=hub.publish, args=(USER.upper(), {"n": 1}))
+        thread.start()
+        thread.join()
+
+        event_id, payload = await asyncio.wait_for(queue.get(), 1)
+        assert payload == {"n": 1}
+        assert event_id > 0
+
+    run(scenario())
+
+
+def test_replay_after_last_event_id():
+    async def scenario():
+        hub = MailStreamHub()
+        for n in range(5):
+            hub.publish(USER, {"n": n})
+        ids = [event_id for event_id, _ in hub._history[USER]]
+
+        queue, complete = hub.subscribe(USER, last_event_id=ids[1])
+        assert complete
+        assert [payload["n"] for _, payload in drain(queue)] == [2, 3, 4]
+
+        # Ids keep increasing, so replays are ordered
+        assert ids == sorted(ids)
+
+    run(scenario())
+
+
+def test_no_replay_without_last_event_id():
+    async def scenario():
+        hub = MailStreamHub()
+        hub.publish(USER, {"n": 0})
+        queue, complete = hub.subscribe(USER)
+        assert complete
+        assert queue.empty()
+
+    run(scenario())
+
+
+def test_last_event_id_from_before_this_process_is_incomplete():
+    async def scenario():
+        hub = MailStreamHub()
+        hub.publish(USER, {"n": 0})
+        queue, complete = hub.subscribe(USER, last_event_id=hub._started_id - 1)
+        assert not complete
+        # Whatever is buffered is still replayed
+        assert [payload["n"] for _, payload in drain(queue)] == [0]
+
+    run(scenario())
+
+
+def test_last_event_id_older_than_evicted_buffer_is_incomplete(monkeypatch):
+    monkeypatch.setattr(mail_stream, "REPLAY_BUFFER_SIZE", 3)
+
+    async def scenario():
+        hub = MailStreamHub()
+        hub.publish(USER, {"n": 0})
+        first_id = hub._history[USER][0][0]
+        assert hub.subscribe(USER, last_event_id=first_id)[1]
+
+        for n in range(1, 5):
+            hub.publish(USER, {"n": n})
+        # Events 0 and 1 were pushed out of the buffer
+        queue, complete = hub.subscribe(USER, last_event_id=first_id)
+        assert not complete
+        assert [payload["n"] for _, payload in drain(queue)] == [2, 3, 4]
+
+        latest_evicted = hub._evicted_id[USER]
+        assert hub.subscribe(USER, last_event_id=latest_evicted)[1]
+
+    run(scenario())
+
+
+def test_slow_consumer_is_dropped(monkeypatch):
+    monkeypatch.setattr(mail_stream, "SUBSCRIBER_QUEUE_SIZE", 3)
+
+    async def scenario():
+        hub = MailStreamHub()
+        queue, _ = hub.subscribe(USER)
+        for n in range(4):
+            hub.publish(USER, {"n": n})
+        await asyncio.sleep(0)
+
+        # The backlog is discarded and the None sentinel ends the stream
+        assert queue.get_nowait() is None
+
+    run(scenario())
+
+
+def test_unsubscribe_stops_delivery():
+    async def scenario():
+        hub = MailStreamHub()
+        queue, _ = hub.subscribe(USER)
+        hub.unsubscribe(USER, queue)
+        assert USER not in hub._subscribers
+
+        hub.publish(USER, {"n": 0})
+        await asyncio.sleep(0)
+        assert queue.empty()
+
+    run(scenario())
@@ -0,0 +1,72 @@
+import threading
+
+import pytest
+
+from auth import profiling
+
+
+@pytest.fixture
+def cprofile_mode(monkeypatch):
+    monkeypatch.setattr(profiling, "PROFILING_ENABLED", True)
+    monkeypatch.setattr(profiling, "PROFILE_MODE", "cprofile")
+    monkeypatch.setattr(profiling, "SLOW_JOB_THRESHOLD_MS", 0)
+    monkeypatch.setattr(profiling, "_slow_jobs", profiling.deque(maxlen=10))
+
+
+def test_concurrent_cprofile_jobs_all_run(cprofile_mode):
+    inside = threading.Barrier(4, timeout=5)
+    results = []
+
+    def work(n):
+        inside.wait()   # all four jobs are open at once
+        results.append(n)
+        return n
+
+    threads = [
+        threading.Thread(target=profiling.run_job, args=(f"job-{n}", None, work, n))
+        for n in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(results) == [0, 1, 2, 3]
+    jobs = profiling.slowest_jobs()
+    assert len(jobs) == 4
+    # Exactly one job held the profiler; the rest fell back to the stack dump
+    assert sum("function calls" in (j["profile"] or "") for j in jobs) == 1
+    assert not profiling._profiler_lock.locked()
+
+
+def test_job_runs_when_profiler_cannot_start(cprofile_mode, monkeypatch):
+    class BusyProfile:
+        def enable(self):
+            raise ValueError("Another profiling tool is already active")
+
+    monkeypatch.setattr(profiling.cProfile, "Profile", BusyProfile)
+    assert profiling.run_job("push", "abc", lambda: "done") == "done"
+    assert profiling.slowest_jobs()[0]["trace_id"] == "abc"
+    assert not profiling._profiler_lock.locked()
+
+
+def test_profiler_is_released_when_job_fails(cprofile_mode):
+    def fail():
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        profiling.run_job("push", None, fail)
+    assert not profiling._profiler_lock.locked()
+
+
+def test_spans_and_trace_id(cprofile_mode, monkeypatch):
+    monkeypatch.setattr(profiling, "PROFILE_MODE", "stack")
+
+    @profiling.traced("parse")
+    def parse():
+        return profiling.trace_tag()
+
+    with profiling.job("push", "t1", queued_at=profiling.time.perf_counter()) as current:
+        assert parse() == "[trace t1] "
+    assert set(current.stages()) == {"queue_wait", "parse"}
+    assert profiling.trace_tag() == ""
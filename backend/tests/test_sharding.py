@@ -0,0 +1,124 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+
+from auth import sharding
+from auth.sharding import HashRing, parse_nodes
+
+USERS = [f"student{i}@vitapstudent.ac.in" for i in range(5000)]
+
+
+def owners(ring):
+    return {user: ring.owner(user) for user in USERS}
+
+
+def test_adding_a_node_only_moves_keys_to_it():
+    ring = HashRing({f"node-{i}": f"http://node-{i}" for i in range(4)})
+    before = owners(ring)
+    ring.add_node("node-4", "http://node-4")
+    after = owners(ring)
+
+    moved = [user for user in USERS if before[user] != after[user]]
+    assert all(after[user] == "node-4" for user in moved)
+    # About 1/N of the users move to the new node
+    assert 0.12 < len(moved) / len(USERS) < 0.28
+
+
+def test_removing_a_node_only_moves_its_keys():
+    ring = HashRing({f"node-{i}": f"http://node-{i}" for i in range(5)})
+    before = owners(ring)
+    ring.remove_node("node-2")
+    after = owners(ring)
+
+    for user in USERS:
+        if before[user] == "node-2":
+            assert after[user] != "node-2"
+        else:
+            assert after[user] == before[user]
+
+
+def test_owner_is_case_insensitive():
+    ring = HashRing({"a": "http://a", "b": "http://b", "c": "http://c"})
+    for user in USERS[:200]:
+        assert ring.owner(user.upper()) == ring.owner(user)
+
+
+def test_empty_ring_has_no_owner():
+    assert HashRing().owner("student@vitapstudent.ac.in") is None
+
+
+def test_parse_nodes():
+    assert parse_nodes("") == {}
+    assert parse_nodes(" a=http://h1:8001/ , b=http://h2:8002,") == {
+        "a": "http://h1:8001",
+        "b": "http://h2:8002"
+    }
+
+
+@pytest.mark.parametrize("nodes, node_id", [
+    ({}, ""),                  # sharding not configured
+    ({}, "a"),                 # SHARD_NODE_ID without SHARD_NODES
+    ({"a": "http://a", "b": "http://b"}, ""),  # SHARD_NODES without SHARD_NODE_ID
+])
+def test_is_local_without_full_config(monkeypatch, nodes, node_id):
+    monkeypatch.setattr(sharding, "ring", HashRing(nodes))
+    monkeypatch.setattr(sharding, "SHARD_NODE_ID", node_id)
+    assert all(sharding.is_local(user) for user in USERS[:100])
+
+
+def test_is_local_splits_users_between_nodes(monkeypatch):
+    ring = HashRing({"a": "http://a", "b": "http://b"})
+    monkeypatch.setattr(sharding, "ring", ring)
+    monkeypatch.setattr(sharding, "SHARD_NODE_ID", "a")
+    for user in USERS[:200]:
+        assert sharding.is_local(user) == (ring.owner(user) == "a")
+    assert sharding.is_local(None)
+
+
+@pytest.fixture
+def owner_server():
+    received = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            length = int(self.headers["Content-Length"])
+            received.append((self.path, self.headers, json.loads(self.rfile.read(length))))
+            status = 500 if self.path == "/fail" else 200
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.end_headers()
+            self.wfile.write(json.dumps({"path": self.path}).encode())
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}", received
+    server.shutdown()
+
+
+def test_forward_to_owner(monkeypatch, owner_server):
+    url, received = owner_server
+    monkeypatch.setattr(sharding, "ring", HashRing({"owner": url}))
+    monkeypatch.setattr(sharding, "SHARD_NODE_ID", "other")
+
+    status, content = sharding.forward_to_owner("a@x", "/auth/google/sync", headers={"user-email": "a@x"})
+    assert status == 200
+    assert json.loads(content) == {"path": "/auth/google/sync"}
+    path, headers, body = received[0]
+    assert headers[sharding.FORWARDED_HEADER] == "other"
+    assert headers["user-email"] == "a@x"
+
+    # Errors from the owner are passed through, not treated as unreachable
+    assert sharding.forward_to_owner("a@x", "/fail")[0] == 500
+    assert sharding.forward_push("a@x", {"message": {}}) is True
+
+
+def test_forward_to_unreachable_owner(monkeypatch):
+    monkeypatch.setattr(sharding, "ring", HashRing({"owner": "http://127.0.0.1:9"}))
+    assert sharding.forward_to_owner("a@x", "/pubsub/gmail", timeout=1) is None
+    assert sharding.forward_push("a@x", {}) is False